@@ -12,8 +12,14 @@ WARNING: this module is not DBAPI 2.0 compliant by itself
 
 __version__ = "$Revision$ $Date$"
 
+import collections
 import logging
-from six.moves.urllib import parse
+import re
+import uuid
+import weakref
+
+from operator import methodcaller
+from six import iteritems
 
 __uri_create_methods = {}
 
@@ -26,9 +32,92 @@ METHOD_MODULE = 1
 METHOD_C14N_URI = 2
 METHOD_ESCAPE = 3
 METHOD_CAST = 4
+METHOD_BULK_EXEC = 5
+METHOD_RELEASE = 6
+METHOD_RECONNECT_EXC = 7
 
 log = logging.getLogger("xivo.anysql")
 
+_ROW_CLASS_CACHE_SIZE = 256
+_row_classes = {}
+
+_NOT_IDENTIFIER_CHARS_REGEX = re.compile(r'\W')
+
+
+def _get_row_class(columns):
+    """
+    Return a namedtuple class whose fields are named after columns.
+    Column names that are not valid Python identifiers are sanitized
+    (e.g. "table.col" gives the field "table_col"), and the remaining
+    invalid or duplicate names are replaced by positional names.
+    """
+    try:
+        return _row_classes[columns]
+    except KeyError:
+        pass
+
+    if len(_row_classes) >= _ROW_CLASS_CACHE_SIZE:
+        _row_classes.clear()
+
+    field_names = [_NOT_IDENTIFIER_CHARS_REGEX.sub('_', col) for col in columns]
+    row_class = collections.namedtuple('Row', field_names, rename=True)
+    _row_classes[columns] = row_class
+    return row_class
+
+
+_PREPARED_QUERY_CACHE_SIZE = 256
+_prepared_queries = {}
+
+
+def _prepare_query(sql_query, columns, escape):
+    """
+    Return a (prepared_query, col2idx_map, row_class) tuple, where
+    prepared_query is sql_query with "${columns}" replaced by the
+    escaped columns.
+    Results are cached, keyed by (sql_query, columns, escape).
+    """
+    key = (sql_query, columns, escape)
+    try:
+        return _prepared_queries[key]
+    except KeyError:
+        pass
+
+    if "${columns}" not in sql_query:
+        raise TypeError("received columns but ${columns} not in query")
+
+    col2idx_map = {col: idx for idx, col in enumerate(columns)}
+    prepared_query = sql_query.replace("${columns}", ",".join(map(escape, columns)), 1)
+    prepared = (prepared_query, col2idx_map, _get_row_class(columns))
+
+    if len(_prepared_queries) >= _PREPARED_QUERY_CACHE_SIZE:
+        _prepared_queries.clear()
+    _prepared_queries[key] = prepared
+    return prepared
+
+
+class row(list):
+    """
+    List based row that is also indexable by column names.
+    """
+
+    __slots__ = ('_col2idx_map',)
+
+    def __init__(self, col2idx_map, dbapi2_result):
+        list.__init__(self, dbapi2_result)
+        self._col2idx_map = col2idx_map
+
+    def __getitem__(self, k):
+        if isinstance(k, int):
+            return list.__getitem__(self, k)
+        else:
+            return list.__getitem__(self, self._col2idx_map[k])
+
+    def iteritems(self):
+        return (
+            (k, list.__getitem__(self, pos))
+            for (k, pos) in iteritems(self._col2idx_map)
+        )
+
 
 class cursor(object):
     """
@@ -53,39 +142,50 @@ class cursor(object):
 
     .fetchone()
     .fetchmany()
-    .fetchall()     return near DBAPI2.0 compatible rows (list based
-                    instead of tuple based) that are also indexable by
-                    their column names.
+    .fetchall()     return DBAPI2.0 compatible rows which are namedtuples
+                    whose fields are named after the columns given to
+                    .query(), or the rows of the underlying DBAPI2.0
+                    cursor if no columns were given.
+
+    If the cursor is created with legacy_rows=True, .fetchXYZ() instead
+    return near DBAPI2.0 compatible rows (list based instead of tuple
+    based) that are also indexable by their column names.
     """
 
-    class row(list):
-        def __init__(self, col2idx_map, dbapi2_result):
-            list.__init__(self, dbapi2_result)
-            self.__col2idx_map = col2idx_map
-
-        def __getitem__(self, k):
-            if isinstance(k, int):
-                return list.__getitem__(self, k)
-            else:
-                return list.__getitem__(self, self.__col2idx_map[k])
-
-        def iteritems(self):
-            return (
-                (k, list.__getitem__(self, pos))
-                for (k, pos) in self.__col2idx_map.iteritems()
-            )
+    __slots__ = (
+        '__connection',
+        '__dbapi2_cursor',
+        '__methods',
+        '__legacy_rows',
+        '__col2idx_map',
+        '__row_cls',
+        '__qmark',
+        '__run',
+    )
+
+    row = row
 
-    def __init__(self, connection, methods):
+    def __init__(self, connection, methods, legacy_rows=False):
         """
         WARNING: For internal use only.
         - dbapi2_cursor is an underlying DBAPI2.0 cursor
         - methods: private object describing the underlying backend,
           internally generated by this module using information
           provided by the backend at registration time.
+        - legacy_rows: return rows indexable by column names instead
+          of namedtuples
         """
         self.__connection = connection
         self.__dbapi2_cursor = connection._get_raw_cursor()
         self.__methods = methods
+        self.__legacy_rows = legacy_rows
+        self.__col2idx_map = None
+        self.__row_cls = None
+        self.__qmark = methods[METHOD_MODULE].paramstyle == "qmark"
+        if self.__qmark:
+            self.__run = self.__run_qmark
+        else:
+            self.__run = self.__run_native
 
     def close(self):
         "As in DBAPI2.0"
@@ -99,21 +199,14 @@ class cursor(object):
         WARNING: It is not recommended to SELECT *
         """
         if columns:
-            if "${columns}" not in sql_query:
-                raise TypeError("received columns but ${columns} not in query")
-
-            escape = self.__methods[METHOD_ESCAPE]
-
-            self.__col2idx_map = {}
-            col_list = []
-
-            for idx, col in enumerate(columns):
-                self.__col2idx_map[col] = idx
-                col_list.append(escape(col))
+            prepared_query, self.__col2idx_map, self.__row_cls = _prepare_query(
+                sql_query, tuple(columns), self.__methods[METHOD_ESCAPE]
+            )
 
-            return sql_query.replace("${columns}", ",".join(col_list))
+            return prepared_query
         else:
             self.__col2idx_map = None
+            self.__row_cls = None
 
             return sql_query
 
@@ -131,114 +224,149 @@ class cursor(object):
         """
         tmp_query = self.__preparequery(sql_query, columns)
 
-        if self.__methods[METHOD_MODULE].paramstyle == "qmark":
-            if parameters is not None:
-                tmp_query = tmp_query % parameters
-                parameters = None
+        self.__with_retry(self.__run, tmp_query, parameters)
 
+    def __with_retry(self, func, *args):
+        """
+        Call func with the underlying DBAPI2.0 cursor followed by args.
+        If it raises one of the exceptions registered by the backend as
+        requiring a reconnection, reconnect and call func once more with
+        a new cursor.
+        """
         try:
-            if parameters is None:
-                self.__dbapi2_cursor.execute(tmp_query)
-            else:
-                self.__dbapi2_cursor.execute(tmp_query, parameters)
-        except Exception:
-            # try to reconnect
+            return func(self.__dbapi2_cursor, *args)
+        except self.__methods[METHOD_RECONNECT_EXC]:
             self.__connection.reconnect()
             self.__dbapi2_cursor = self.__connection._get_raw_cursor()
 
-            if parameters is None:
-                self.__dbapi2_cursor.execute(tmp_query)
-            else:
-                self.__dbapi2_cursor.execute(tmp_query, parameters)
+            return func(self.__dbapi2_cursor, *args)
+
+    @staticmethod
+    def __run_native(dbapi2_cursor, sql_query, parameters):
+        if parameters is None:
+            dbapi2_cursor.execute(sql_query)
+        else:
+            dbapi2_cursor.execute(sql_query, parameters)
+
+    @staticmethod
+    def __run_qmark(dbapi2_cursor, sql_query, parameters):
+        if parameters is not None:
+            sql_query = sql_query % parameters
+        dbapi2_cursor.execute(sql_query)
 
     def querymany(self, sql_query, columns, seq_of_parameters):
         """
         Same as .query() but eventually call the .executemany() method
         of the underlying DBAPI2.0 cursor instead of .execute()
+
+        If the backend registered a bulk_exec method and seq_of_parameters
+        is a list or a tuple, the bulk_exec method is used instead of
+        .executemany() so that the backend can send the parameters in
+        batches instead of one round-trip per row.
+        WARNING: in that case, .rowcount is not the total number of rows
+        affected by the queries but depends on the backend (for
+        PostgreSQL, it only reflects the last statement sent).
         """
         tmp_query = self.__preparequery(sql_query, columns)
 
-        if self.__methods[METHOD_MODULE].paramstyle == "qmark":
+        if self.__qmark:
             raise NotImplementedError("qmark isn't fully supported")
 
-        try:
-            self.__dbapi2_cursor.executemany(tmp_query, seq_of_parameters)
-        except Exception:
-            self.__connection.reconnect()
-            self.__dbapi2_cursor = self.__connection._get_raw_cursor()
+        self.__with_retry(self.__executemany, tmp_query, seq_of_parameters)
 
-            self.__dbapi2_cursor.executemany(tmp_query, seq_of_parameters)
+    def __executemany(self, dbapi2_cursor, sql_query, seq_of_parameters):
+        bulk_exec = self.__methods[METHOD_BULK_EXEC]
+        if bulk_exec is not None and isinstance(seq_of_parameters, (list, tuple)):
+            bulk_exec(dbapi2_cursor, sql_query, seq_of_parameters)
+        else:
+            dbapi2_cursor.executemany(sql_query, seq_of_parameters)
 
-    def fetchone(self):
+    def stream(self, sql_query, columns=None, parameters=None, itersize=2000):
         """
-        As in DBAPI2.0 (except the fact rows are not tuples but
-        lists so if you try to modify them, you will succeed instead of
-        the correct behaviour of raising an exception).
-        Additionally every row returned by this class is addressable
-        by column name besides the column position in the query.
+        Same as .query() followed by .fetchall(), but return a generator
+        of rows. The query is executed using a server side cursor, and
+        the rows are fetched from the server itersize at a time, so
+        large result sets are never fully held in memory.
+        WARNING: the underlying DBAPI2.0 module must support named
+        cursors (e.g. psycopg2).
+        WARNING: no reconnection is attempted on errors.
         """
+        if columns:
+            tmp_query, col2idx_map, row_cls = _prepare_query(
+                sql_query, tuple(columns), self.__methods[METHOD_ESCAPE]
+            )
+        else:
+            tmp_query, col2idx_map, row_cls = sql_query, None, None
+
+        return self.__stream(tmp_query, col2idx_map, row_cls, parameters, itersize)
+
+    def __stream(self, sql_query, col2idx_map, row_cls, parameters, itersize):
+        server_cursor = self.__connection._get_server_cursor(
+            'anysql_%s' % uuid.uuid4().hex
+        )
         try:
-            result = self.__dbapi2_cursor.fetchone()
-        except Exception:
-            self.__connection.reconnect()
-            self.__dbapi2_cursor = self.__connection._get_raw_cursor()
+            server_cursor.itersize = itersize
+            self.__run(server_cursor, sql_query, parameters)
+
+            for dbapi2_row in server_cursor:
+                if col2idx_map is None:
+                    yield dbapi2_row
+                elif self.__legacy_rows:
+                    yield self.row(col2idx_map, dbapi2_row)
+                else:
+                    yield row_cls._make(dbapi2_row)
+        finally:
+            server_cursor.close()
 
-            result = self.__dbapi2_cursor.fetchone()
+    def fetchone(self):
+        """
+        As in DBAPI2.0, except that rows are augmented as described in
+        the documentation of this class.
+        """
+        result = self.__with_retry(methodcaller('fetchone'))
 
-        if not result:
+        if not result or self.__col2idx_map is None:
             return result
-        else:
+        elif self.__legacy_rows:
             return self.row(self.__col2idx_map, result)
+        else:
+            return self.__row_cls._make(result)
 
     def fetchmany(self, size=None):
         """
-        As in DBAPI2.0 (except the fact rows are not tuples but
-        lists so if you try to modify them, you will succeed instead of
-        the correct behavior that would be that an exception would have
-        been raised)
-        Additionally every row returned by this class is addressable
-        by column name besides the column position in the query.
+        As in DBAPI2.0, except that rows are augmented as described in
+        the documentation of this class.
         """
-        try:
-            if size is None:
-                manyrows = self.__dbapi2_cursor.fetchmany()
-            else:
-                manyrows = self.__dbapi2_cursor.fetchmany(size)
-        except Exception:
-            self.__connection.reconnect()
-            self.__dbapi2_cursor = self.__connection._get_raw_cursor()
-
-            if size is None:
-                manyrows = self.__dbapi2_cursor.fetchmany()
-            else:
-                manyrows = self.__dbapi2_cursor.fetchmany(size)
+        if size is None:
+            manyrows = self.__with_retry(methodcaller('fetchmany'))
+        else:
+            manyrows = self.__with_retry(methodcaller('fetchmany', size))
 
         if not manyrows:
             return manyrows
         else:
-            return [self.row(self.__col2idx_map, dbapi2_row) for dbapi2_row in manyrows]
+            return self.__make_rows(manyrows)
 
     def fetchall(self):
         """
-        As in DBAPI2.0 (except the fact rows are not tuples but
-        lists so if you try to modify them, you will succeed instead of
-        the correct behavior that would be that an exception would have
-        been raised)
-        Additionally every row returned by this class is addressable
-        by column name besides the column position in the query.
+        As in DBAPI2.0, except that rows are augmented as described in
+        the documentation of this class.
         """
-        try:
-            allrows = self.__dbapi2_cursor.fetchall()
-        except Exception:
-            self.__connection.reconnect()
-            self.__dbapi2_cursor = self.__connection._get_raw_cursor()
-
-            allrows = self.__dbapi2_cursor.fetchall()
+        allrows = self.__with_retry(methodcaller('fetchall'))
 
         if not allrows:
             return allrows
         else:
-            return [self.row(self.__col2idx_map, dbapi2_row) for dbapi2_row in allrows]
+            return self.__make_rows(allrows)
+
+    def __make_rows(self, dbapi2_rows):
+        if self.__col2idx_map is None:
+            return dbapi2_rows
+        elif self.__legacy_rows:
+            col2idx_map = self.__col2idx_map
+            return [self.row(col2idx_map, dbapi2_row) for dbapi2_row in dbapi2_rows]
+        else:
+            return list(map(self.__row_cls._make, dbapi2_rows))
 
     def setinputsizes(self, sizes):
         "As in DBAPI2.0"
@@ -279,7 +407,7 @@ class cursor(object):
     arraysize = property(__get_arraysize, __set_arraysize, None, "As in DBAPI2.0")
 
 
-class connection:
+class connection(object):
     """
     This class is a Anysql wrapper for DBAPI2.0 Connection Objects.
     It does not do much: essentially it just pass method calls to the
@@ -295,6 +423,8 @@ class connection:
     .query() instead of .execute())
     """
 
+    __slots__ = ('sqluri', '__methods', '__dbapi2_conn', '__dbapi2_cursors')
+
     def __init__(self, sqluri):
         """
         Contructor: takes two arguments
@@ -306,6 +436,7 @@ class connection:
         and is automatically performed by connect_by_uri()
         """
         self.sqluri = sqluri
+        self.__dbapi2_cursors = weakref.WeakSet()
         self.__connect()
 
     def __connect(self):
@@ -322,6 +453,10 @@ class connection:
         Reconnect to the database.
         """
         log.warning('reconnecting to %s database' % self.sqluri)
+        release = self.__methods[METHOD_RELEASE]
+        if release is not None and self.__dbapi2_conn is not None:
+            dbapi2_conn, self.__dbapi2_conn = self.__dbapi2_conn, None
+            release(self.sqluri, dbapi2_conn, close=True)
         self.__connect()
 
     def close(self):
@@ -335,8 +470,31 @@ class connection:
         connection.  Note that closing a connection without
         committing the changes first will cause an implicit
         rollback to be performed.
+        If the backend pools its connections, the underlying DBAPI2.0
+        connection is given back to the pool instead of being closed,
+        after closing the cursors created from it. A connection that
+        is never closed is not given back to the pool.
+        Closing an already closed connection does nothing.
         """
-        self.__dbapi2_conn.close()
+        if self.__dbapi2_conn is None:
+            return
+
+        dbapi2_conn, self.__dbapi2_conn = self.__dbapi2_conn, None
+        release = self.__methods[METHOD_RELEASE]
+        if release is None:
+            dbapi2_conn.close()
+        else:
+            for dbapi2_cursor in list(self.__dbapi2_cursors):
+                dbapi2_cursor.close()
+            release(self.sqluri, dbapi2_conn)
+        self.__dbapi2_cursors.clear()
+
+    def __get_dbapi2_conn(self):
+        if self.__dbapi2_conn is None:
+            raise self.__methods[METHOD_MODULE].InterfaceError(
+                'connection already closed'
+            )
+        return self.__dbapi2_conn
 
     def commit(self):
         """
@@ -349,7 +507,7 @@ class connection:
         Database modules that do not support transactions should
         implement this method with void functionality.
         """
-        self.__dbapi2_conn.commit()
+        self.__get_dbapi2_conn().commit()
 
     def rollback(self):
         """
@@ -363,9 +521,9 @@ class connection:
         committing the changes first will cause an implicit
         rollback to be performed.
         """
-        self.__dbapi2_conn.rollback()
+        self.__get_dbapi2_conn().rollback()
 
-    def cursor(self):
+    def cursor(self, legacy_rows=False):
         """
         Returns a new Cursor Object using the connection,
         that is NOT a DBAPI2.0 cursor.
@@ -375,19 +533,31 @@ class connection:
         latter.
         The Cursor Object returned by this method will be an instance
         of the class cursor of this module.
+        If legacy_rows is true, the rows returned by the Cursor Object
+        are indexable by column names instead of being namedtuples.
         """
-        return cursor(self, self.__methods)
+        return cursor(self, self.__methods, legacy_rows)
 
     def _get_raw_cursor(self):
         """
             Return a new DBAPI2.0 cursor object.
         """
-        return self.__dbapi2_conn.cursor()
+        dbapi2_cursor = self.__get_dbapi2_conn().cursor()
+        self.__dbapi2_cursors.add(dbapi2_cursor)
+        return dbapi2_cursor
+
+    def _get_server_cursor(self, name):
+        """
+        Return a new named (server side) DBAPI2.0 cursor object.
+        """
+        dbapi2_cursor = self.__get_dbapi2_conn().cursor(name=name)
+        self.__dbapi2_cursors.add(dbapi2_cursor)
+        return dbapi2_cursor
 
 
 def __compare_api_level(als1, als2):
-    lst1 = map(int, als1.split('.'))
-    lst2 = map(int, als2.split('.'))
+    lst1 = tuple(int(x) for x in als1.split('.'))
+    lst2 = tuple(int(x) for x in als2.split('.'))
     if lst1 < lst2:
         return -1 - bool(lst1[0] < lst2[0])
     elif lst1 > lst2:
@@ -397,7 +567,15 @@ def __compare_api_level(als1, als2):
 
 
 def register_uri_backend(
-    uri_scheme, create_method, module, c14n_uri_method, escape, cast
+    uri_scheme,
+    create_method,
+    module,
+    c14n_uri_method,
+    escape,
+    cast,
+    bulk_exec=None,
+    release=None,
+    reconnect_exceptions=(Exception,),
 ):
     """
     This method is intended to be used by backends only.
@@ -420,6 +598,22 @@ def register_uri_backend(
     column name) and returns an escaped version for use as an escaped
     column name in an SQL query for this backend.
 
+    bulk_exec, if not None, must be a function that takes three arguments
+    (a DBAPI2.0 cursor of the backend, an SQL query and a sequence of
+    parameters) and that has the same effect as the .executemany() method
+    of the cursor, using a faster backend specific mechanism.
+
+    release, if not None, must be a function that takes the URI, a
+    connection returned by create_method and an optional close boolean
+    argument. It is called instead of the .close() method of the
+    connection, so that backends can pool their connections. If close is
+    true, the connection must not be reused.
+
+    reconnect_exceptions is a tuple of the exception classes that are
+    raised by the backend when the connection needs to be reestablished.
+    Queries and fetches raising one of these exceptions are retried once
+    after reconnecting.
+
     If something obviously not compatible is tried to be registred,
     NotImplementedError is raised.
     """
@@ -452,11 +646,14 @@ def register_uri_backend(
         c14n_uri_method,
         escape,
         cast,
+        bulk_exec,
+        release,
+        reconnect_exceptions,
     )
 
 
 def _get_methods_by_uri(sqluri):
-    uri_scheme = parse.urlsplit(sqluri)[0]
+    uri_scheme = sqluri.partition(':')[0].lower()
     if uri_scheme not in __uri_create_methods:
         raise NotImplementedError('Unknown URI scheme "%s"' % str(uri_scheme))
     return __uri_create_methods[uri_scheme]
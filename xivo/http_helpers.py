@@ -2,12 +2,20 @@
 # Copyright 2016-2019 The Wazo Authors  (see the AUTHORS file)
 # SPDX-License-Identifier: GPL-3.0-or-later
 
+import logging
+import os
 import re
 
 from cheroot.ssl.builtin import BuiltinSSLAdapter
 from flask import current_app, request
 from six.moves.urllib.parse import unquote
 
+try:
+    # google-re2 matches without backtracking and has the same API as re
+    import re2 as _token_re
+except ImportError:
+    _token_re = re
+
 
 class ReverseProxied(object):
     '''
@@ -103,26 +111,42 @@ def log_before_request():
 
 
 def log_request(response):
+    if not current_app.logger.isEnabledFor(logging.INFO):
+        return response
+
     url = unquote(request.url)
     _log_request(url, response)
     return response
 
 
-_REPLACE_TOKEN_REGEX = re.compile(r'\btoken=[-0-9a-zA-Z]+')
+_REPLACE_TOKEN_REGEX = _token_re.compile(r'\btoken=[-0-9a-zA-Z]+')
 
 
 def log_request_hide_token(response):
+    if not current_app.logger.isEnabledFor(logging.INFO):
+        return response
+
     url = unquote(request.url)
     url = _REPLACE_TOKEN_REGEX.sub('token=<hidden>', url)
     _log_request(url, response)
     return response
 
 
+_ssl_adapters = {}
+
+
 def ssl_adapter(certificate, private_key):
+    mtimes = (os.stat(certificate).st_mtime, os.stat(private_key).st_mtime)
+    cached = _ssl_adapters.get((certificate, private_key))
+    if cached is not None and cached[0] == mtimes:
+        return cached[1]
+
     _check_file_readable(certificate)
     _check_file_readable(private_key)
 
-    return BuiltinSSLAdapter(certificate, private_key)
+    adapter = BuiltinSSLAdapter(certificate, private_key)
+    _ssl_adapters[(certificate, private_key)] = (mtimes, adapter)
+    return adapter
 
 
 def _check_file_readable(file_path):
@@ -131,10 +155,7 @@ def _check_file_readable(file_path):
 
 
 def list_routes(app):
-    output = []
-    for rule in app.url_map.iter_rules():
-        methods = ','.join(rule.methods)
-        line = "{:50s} {:20s} {}".format(rule.endpoint, methods, rule)
-        output.append(line)
-
-    return output
+    return [
+        "%s %s %s" % (rule.endpoint.ljust(50), ','.join(rule.methods).ljust(20), rule)
+        for rule in app.url_map.iter_rules()
+    ]
@@ -2,12 +2,14 @@
 # Copyright 2016-2019 The Wazo Authors  (see the AUTHORS file)
 # SPDX-License-Identifier: GPL-3.0-or-later
 
+import json
+
 from functools import wraps
 
 import marshmallow
 
 from .mallow import fields, validate
-from .rest_api_helpers import APIException
+from .rest_api_helpers import APIException, format_api_exception
 
 
 class ValidationError(APIException):
@@ -20,7 +22,27 @@ class ValidationError(APIException):
         )
 
 
+def install_validation_handler(app):
+    """
+    Convert the marshmallow.ValidationError raised by any view of the Flask
+    app into a 400 response, without wrapping each view with
+    handle_validation_exception.
+    """
+    app.register_error_handler(
+        marshmallow.ValidationError, _handle_marshmallow_validation_error
+    )
+
+
+def _handle_marshmallow_validation_error(error):
+    response, status_code = format_api_exception(ValidationError(error.messages))
+    return json.dumps(response), status_code, {'Content-Type': 'application/json'}
+
+
 def handle_validation_exception(func):
+    """
+    Legacy per-view equivalent of install_validation_handler.
+    """
+
     @wraps(func)
     def wrapper(*args, **kwargs):
         try:
@@ -65,9 +87,8 @@ class ListSchema(marshmallow.Schema):
 
     @marshmallow.post_load(pass_original=True)
     def add_searchable_fields(self, data, original_data):
-        for key, value in original_data.items():
-            if key in self.searchable_columns:
-                data.setdefault(key, value)
+        for key in set(original_data).intersection(self.searchable_columns):
+            data.setdefault(key, original_data[key])
 
         return data
 
@@ -27,20 +27,24 @@ def handle_api_exception(func):
         try:
             return func(*args, **kwargs)
         except APIException as error:
-            response = {
-                'message': error.message,
-                'error_id': error.id_,
-                'details': error.details,
-                'timestamp': time.time(),
-            }
-            if error.resource:
-                response['resource'] = error.resource
-            logger.error('%s: %s', error.message, error.details)
-            return response, error.status_code
+            return format_api_exception(error)
 
     return wrapper
 
 
+def format_api_exception(error):
+    response = {
+        'message': error.message,
+        'error_id': error.id_,
+        'details': error.details,
+        'timestamp': time.time(),
+    }
+    if error.resource:
+        response['resource'] = error.resource
+    logger.error('%s: %s', error.message, error.details)
+    return response, error.status_code
+
+
 def load_all_api_specs(entry_point_group, spec_filename):
     for module in iter_entry_points(group=entry_point_group):
         try:
@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import unittest
+
+from hamcrest import assert_that
+from hamcrest import contains
+from hamcrest import equal_to
+from mock import Mock
+from mock import patch
+from mock import sentinel
+
+from .. import anysql
+
+
+def _escape(column):
+    return '"%s"' % column
+
+
+class TestCursor(unittest.TestCase):
+    def setUp(self):
+        self.module = Mock(paramstyle='format')
+        self.bulk_exec = Mock()
+        self.connection = Mock()
+        self.dbapi2_cursor = self.connection._get_raw_cursor.return_value
+        self.methods = (
+            sentinel.connect,
+            self.module,
+            None,
+            _escape,
+            None,
+            self.bulk_exec,
+            None,
+            (ValueError,),
+        )
+        self.cursor = anysql.cursor(self.connection, self.methods)
+
+    def test_querymany_uses_bulk_exec_with_a_list(self):
+        parameters = [(1,), (2,)]
+
+        self.cursor.querymany('INSERT INTO t VALUES (%s)', None, parameters)
+
+        self.bulk_exec.assert_called_once_with(
+            self.dbapi2_cursor, 'INSERT INTO t VALUES (%s)', parameters
+        )
+        assert_that(self.dbapi2_cursor.executemany.called, equal_to(False))
+
+    def test_querymany_uses_executemany_with_an_iterator(self):
+        parameters = iter([(1,), (2,)])
+
+        self.cursor.querymany('INSERT INTO t VALUES (%s)', None, parameters)
+
+        self.dbapi2_cursor.executemany.assert_called_once_with(
+            'INSERT INTO t VALUES (%s)', parameters
+        )
+        assert_that(self.bulk_exec.called, equal_to(False))
+
+    def test_fetchall_returns_namedtuples(self):
+        self.dbapi2_cursor.fetchall.return_value = [(1, 'foo'), (2, 'bar')]
+
+        self.cursor.query('SELECT ${columns} FROM t', ('t.id', 'name'))
+        rows = self.cursor.fetchall()
+
+        self.dbapi2_cursor.execute.assert_called_once_with(
+            'SELECT "t.id","name" FROM t'
+        )
+        assert_that(rows, contains((1, 'foo'), (2, 'bar')))
+        assert_that(rows[0].t_id, equal_to(1))
+        assert_that(rows[1].name, equal_to('bar'))
+
+    def test_query_escapes_columns_once_per_query(self):
+        escape = Mock(side_effect=_escape)
+        methods = self.methods[:3] + (escape,) + self.methods[4:]
+        cursor = anysql.cursor(self.connection, methods)
+
+        cursor.query('SELECT ${columns} FROM cached', ('id',))
+        cursor.query('SELECT ${columns} FROM cached', ('id',))
+
+        escape.assert_called_once_with('id')
+        assert_that(self.dbapi2_cursor.execute.call_count, equal_to(2))
+
+    def test_query_qmark_parameters_are_interpolated(self):
+        self.module.paramstyle = 'qmark'
+        cursor = anysql.cursor(self.connection, self.methods)
+
+        cursor.query('SELECT id FROM t WHERE id = %s', parameters=(42,))
+
+        self.dbapi2_cursor.execute.assert_called_once_with(
+            'SELECT id FROM t WHERE id = 42'
+        )
+
+    def test_query_reconnects_on_reconnect_exceptions(self):
+        new_dbapi2_cursor = Mock()
+        self.connection._get_raw_cursor.side_effect = [
+            self.dbapi2_cursor,
+            new_dbapi2_cursor,
+        ]
+        self.dbapi2_cursor.execute.side_effect = ValueError()
+        cursor = anysql.cursor(self.connection, self.methods)
+
+        cursor.query('SELECT 1')
+
+        self.connection.reconnect.assert_called_once_with()
+        new_dbapi2_cursor.execute.assert_called_once_with('SELECT 1')
+
+    def test_query_does_not_reconnect_on_other_exceptions(self):
+        self.dbapi2_cursor.execute.side_effect = KeyError()
+
+        self.assertRaises(KeyError, self.cursor.query, 'SELECT 1')
+        assert_that(self.connection.reconnect.called, equal_to(False))
+
+    def test_query_columns_without_placeholder(self):
+        self.assertRaises(TypeError, self.cursor.query, 'SELECT id FROM t', ('id',))
+
+    def test_fetchall_without_columns_returns_raw_rows(self):
+        dbapi2_rows = [(1, 'foo')]
+        self.dbapi2_cursor.fetchall.return_value = dbapi2_rows
+
+        self.cursor.query('SELECT id, name FROM t')
+        rows = self.cursor.fetchall()
+
+        assert_that(rows, equal_to(dbapi2_rows))
+
+    def test_stream_uses_a_server_cursor(self):
+        server_cursor = self.connection._get_server_cursor.return_value
+        server_cursor.__iter__ = Mock(return_value=iter([(1, 'foo'), (2, 'bar')]))
+
+        rows = self.cursor.stream(
+            'SELECT ${columns} FROM t WHERE id > %s', ('id', 'name'), (0,), itersize=1
+        )
+
+        assert_that([row.name for row in rows], contains('foo', 'bar'))
+        server_cursor.execute.assert_called_once_with(
+            'SELECT "id","name" FROM t WHERE id > %s', (0,)
+        )
+        assert_that(server_cursor.itersize, equal_to(1))
+        server_cursor.close.assert_called_once_with()
+
+    def test_stream_does_not_change_the_cursor_columns(self):
+        server_cursor = self.connection._get_server_cursor.return_value
+        server_cursor.__iter__ = Mock(return_value=iter([('other',)]))
+        self.dbapi2_cursor.fetchall.return_value = [(1, 'foo')]
+
+        self.cursor.query('SELECT ${columns} FROM t', ('id', 'name'))
+        list(self.cursor.stream('SELECT ${columns} FROM u', ('other',)))
+        rows = self.cursor.fetchall()
+
+        assert_that(rows[0].name, equal_to('foo'))
+
+    def test_stream_columns_without_placeholder(self):
+        self.assertRaises(TypeError, self.cursor.stream, 'SELECT id FROM t', ('id',))
+
+    def test_legacy_row_iteritems(self):
+        row = anysql.row({'id': 0, 'name': 1}, (1, 'foo'))
+
+        assert_that(dict(row.iteritems()), equal_to({'id': 1, 'name': 'foo'}))
+
+    def test_fetchone_returns_legacy_rows(self):
+        cursor = anysql.cursor(self.connection, self.methods, legacy_rows=True)
+        self.dbapi2_cursor.fetchone.return_value = (1, 'foo')
+
+        cursor.query('SELECT ${columns} FROM t', ('t.id', 'name'))
+        row = cursor.fetchone()
+
+        assert_that(row, equal_to([1, 'foo']))
+        assert_that(row['t.id'], equal_to(1))
+        assert_that(row['name'], equal_to('foo'))
+
+
+class TestConnection(unittest.TestCase):
+    def setUp(self):
+        self.connect = Mock()
+        self.release = Mock()
+        self.module = Mock(InterfaceError=KeyError)
+        methods = (
+            self.connect,
+            self.module,
+            None,
+            None,
+            None,
+            None,
+            self.release,
+            None,
+        )
+        patcher = patch('xivo.anysql._get_methods_by_uri', return_value=methods)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.connection = anysql.connection(sentinel.uri)
+
+    def test_close_releases_the_connection(self):
+        self.connection.close()
+
+        self.release.assert_called_once_with(sentinel.uri, self.connect.return_value)
+        assert_that(self.connect.return_value.close.called, equal_to(False))
+
+    def test_reconnect_discards_the_connection(self):
+        dbapi2_conn = self.connect.return_value
+
+        self.connection.reconnect()
+
+        self.release.assert_called_once_with(sentinel.uri, dbapi2_conn, close=True)
+        assert_that(self.connect.call_count, equal_to(2))
+
+    def test_close_twice(self):
+        self.connection.close()
+        self.connection.close()
+
+        self.release.assert_called_once_with(sentinel.uri, self.connect.return_value)
+
+    def test_close_closes_the_cursors(self):
+        dbapi2_cursor = self.connection._get_raw_cursor()
+
+        self.connection.close()
+
+        dbapi2_cursor.close.assert_called_once_with()
+
+    def test_use_after_close(self):
+        self.connection.close()
+
+        self.assertRaises(KeyError, self.connection.commit)
+        self.assertRaises(KeyError, self.connection._get_raw_cursor)
+
+    def test_reconnect_after_close(self):
+        self.connection.close()
+
+        self.connection.reconnect()
+        self.connection.commit()
+
+        self.release.assert_called_once_with(sentinel.uri, self.connect.return_value)
+        assert_that(self.connect.call_count, equal_to(2))
+
+    def test_connection_is_not_released_when_garbage_collected(self):
+        del self.connection
+
+        assert_that(self.release.called, equal_to(False))
+
+
+class TestGetMethodsByURI(unittest.TestCase):
+    def setUp(self):
+        uri_create_methods = getattr(anysql, '__uri_create_methods')
+        patcher = patch.dict(uri_create_methods, {'postgresql': sentinel.methods})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_known_scheme(self):
+        result = anysql._get_methods_by_uri('PostgreSQL://u:p@localhost/db')
+
+        assert_that(result, equal_to(sentinel.methods))
+
+    def test_unknown_scheme(self):
+        self.assertRaises(
+            NotImplementedError, anysql._get_methods_by_uri, 'mysql://localhost/db'
+        )
+
+
+class TestRegisterURIBackend(unittest.TestCase):
+    def setUp(self):
+        uri_create_methods = getattr(anysql, '__uri_create_methods')
+        patcher = patch.dict(uri_create_methods)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _register(self, apilevel):
+        module = Mock(apilevel=apilevel, paramstyle='pyformat', threadsafety=2)
+        anysql.register_uri_backend('test', sentinel.connect, module, None, None, None)
+
+    def test_compatible_api_levels(self):
+        self._register('2.0')
+        self._register('2.1')
+
+        result = anysql._get_methods_by_uri('test://localhost')
+
+        assert_that(result[anysql.METHOD_CONNECT], equal_to(sentinel.connect))
+
+    def test_incompatible_api_levels(self):
+        self.assertRaises(NotImplementedError, self._register, '1.0')
+        self.assertRaises(NotImplementedError, self._register, '3.0')
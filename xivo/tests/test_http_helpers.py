@@ -2,12 +2,22 @@
 # Copyright 2016-2019 The Wazo Authors  (see the AUTHORS file)
 # SPDX-License-Identifier: GPL-3.0-or-later
 
+import os
+import tempfile
 import unittest
 
-from hamcrest import assert_that, equal_to
-from mock import patch, sentinel, ANY
+from hamcrest import assert_that, equal_to, has_item, is_not, same_instance
+from mock import Mock, PropertyMock, patch, sentinel, ANY
 
-from xivo.http_helpers import log_request, log_request_hide_token, LazyHeaderFormatter
+from flask import Flask
+
+from xivo.http_helpers import (
+    list_routes,
+    log_request,
+    log_request_hide_token,
+    ssl_adapter,
+    LazyHeaderFormatter,
+)
 
 
 class TestLogRequest(unittest.TestCase):
@@ -34,6 +44,45 @@ class TestLogRequest(unittest.TestCase):
             ANY, request.remote_addr, request.method, expected_url, sentinel.status_code
         )
 
+    def _assert_nothing_logged_when_info_disabled(self, log_function):
+        current_app = Mock()
+        current_app.logger.isEnabledFor.return_value = False
+        request = Mock()
+        url = type(request).url = PropertyMock()
+
+        with patch('xivo.http_helpers.current_app', current_app):
+            with patch('xivo.http_helpers.request', request):
+                result = log_function(sentinel)
+
+        assert_that(result, equal_to(sentinel))
+        assert_that(current_app.logger.info.called, equal_to(False))
+        assert_that(url.called, equal_to(False))
+
+    def test_log_request_info_disabled(self):
+        self._assert_nothing_logged_when_info_disabled(log_request)
+
+    def test_log_request_hide_token_info_disabled(self):
+        self._assert_nothing_logged_when_info_disabled(log_request_hide_token)
+
+
+class TestListRoutes(unittest.TestCase):
+    def test_list_routes(self):
+        app = Flask(__name__)
+        app.add_url_rule(
+            '/foo',
+            'foo',
+            lambda: '',
+            methods=['POST'],
+            provide_automatic_options=False,
+        )
+
+        result = list_routes(app)
+
+        assert_that(
+            result,
+            has_item('{:50s} {:20s} {}'.format('foo', 'POST', '/foo')),
+        )
+
 
 class TestHeaderFormatter(unittest.TestCase):
     def test_that_tokens_are_partially_masked(self):
@@ -61,3 +110,33 @@ class TestHeaderFormatter(unittest.TestCase):
         result = '{}'.format(formatter)
 
         assert_that(result, equal_to("{'Authorization': '<hidden>'}"))
+
+
+@patch('xivo.http_helpers.BuiltinSSLAdapter', side_effect=lambda *args: object())
+class TestSSLAdapter(unittest.TestCase):
+    def setUp(self):
+        self.files = []
+        for _ in range(2):
+            fd, path = tempfile.mkstemp()
+            os.close(fd)
+            self.addCleanup(os.unlink, path)
+            self.files.append(path)
+
+    def test_adapter_is_reused(self, BuiltinSSLAdapter):
+        certificate, private_key = self.files
+
+        first = ssl_adapter(certificate, private_key)
+        second = ssl_adapter(certificate, private_key)
+
+        assert_that(second, same_instance(first))
+        BuiltinSSLAdapter.assert_called_once_with(certificate, private_key)
+
+    def test_adapter_is_recreated_when_files_change(self, BuiltinSSLAdapter):
+        certificate, private_key = self.files
+
+        first = ssl_adapter(certificate, private_key)
+        stat = os.stat(certificate)
+        os.utime(certificate, (stat.st_atime, stat.st_mtime + 1))
+        second = ssl_adapter(certificate, private_key)
+
+        assert_that(second, is_not(same_instance(first)))
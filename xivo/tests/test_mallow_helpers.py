@@ -2,13 +2,16 @@
 # Copyright 2018-2019 The Wazo Authors  (see the AUTHORS file)
 # SPDX-License-Identifier: GPL-3.0-or-later
 
-from collections import OrderedDict
+import json
 import unittest
 
+from collections import OrderedDict
+
 from hamcrest import (
     all_of,
     assert_that,
     empty,
+    equal_to,
     has_entries,
     has_key,
     has_property,
@@ -16,10 +19,29 @@ from hamcrest import (
     instance_of,
     not_,
 )
+from flask import Flask
 from marshmallow import fields, ValidationError
 from xivo_test_helpers.hamcrest.raises import raises
 
-from ..mallow_helpers import ListSchema, Schema
+from ..mallow_helpers import install_validation_handler, ListSchema, Schema
+
+
+class TestInstallValidationHandler(unittest.TestCase):
+    def test_validation_error_response(self):
+        app = Flask(__name__)
+        install_validation_handler(app)
+
+        @app.route('/')
+        def view():
+            raise ValidationError({'key': ['Missing data for required field.']})
+
+        response = app.test_client().get('/')
+
+        assert_that(response.status_code, equal_to(400))
+        assert_that(
+            json.loads(response.get_data(as_text=True)),
+            has_entries(error_id='invalid-data', details=has_key('key')),
+        )
 
 
 class TestSchema(unittest.TestCase):
@@ -56,6 +78,45 @@ class TestListSchema(unittest.TestCase):
 
         assert_that(result, all_of(has_entries(name='foobar'), not_(has_key('other'))))
 
+    def test_arbitrary_field_search_subclass_override(self):
+        class Schema(ListSchema):
+            searchable_columns = ['name']
+
+        class SubSchema(Schema):
+            searchable_columns = ['other']
+
+        raw_data = {'name': 'foobar', 'other': 'foobaz'}
+
+        Schema().load(raw_data)
+        result = SubSchema().load(raw_data)
+
+        assert_that(result, all_of(has_entries(other='foobaz'), not_(has_key('name'))))
+
+    def test_arbitrary_field_search_modified_columns(self):
+        class Schema(ListSchema):
+            searchable_columns = ['name']
+
+        raw_data = {'name': 'foobar', 'other': 'foobaz'}
+
+        Schema().load(raw_data)
+        Schema.searchable_columns.append('other')
+        result = Schema().load(raw_data)
+
+        assert_that(result, has_entries(name='foobar', other='foobaz'))
+
+    def test_arbitrary_field_search_instance_override(self):
+        class Schema(ListSchema):
+            searchable_columns = ['name']
+
+        schema = Schema()
+        schema.searchable_columns = ['other']
+        raw_data = {'name': 'foobar', 'other': 'foobaz'}
+
+        Schema().load(raw_data)
+        result = schema.load(raw_data)
+
+        assert_that(result, all_of(has_entries(other='foobaz'), not_(has_key('name'))))
+
     def test_order_sort_columns(self):
         class Schema(ListSchema):
             sort_columns = ['name']
@@ -74,3 +74,21 @@ class TestTokenRenewer(unittest.TestCase):
         self.token_renewer._renew_token()
 
         callback.assert_not_called()
+
+    def test_renew_token_after_stop(self):
+        callback = Mock()
+        self.auth_client.token.new.return_value = self.token
+        self.token_renewer.subscribe_to_token_change(callback)
+        self.token_renewer._stopped.set()
+
+        self.token_renewer._renew_token()
+
+        callback.assert_not_called()
+
+    def test_run_stops(self):
+        self.auth_client.token.new.return_value = self.token
+
+        self.token_renewer.start()
+        self.token_renewer.stop()
+
+        assert_that(self.token_renewer._thread.is_alive(), equal_to(False))
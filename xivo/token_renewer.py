@@ -14,6 +14,19 @@ class TokenRenewer(object):
     DEFAULT_EXPIRATION = 6 * 3600
     _RENEW_TIME_COEFFICIENT = 0.8
 
+    __slots__ = (
+        '_auth_client',
+        '_expiration',
+        '_callbacks',
+        '_callbacks_tmp',
+        '_started',
+        '_stopped',
+        '_renew_time',
+        '_callback_lock',
+        '_renew_time_failed',
+        '_thread',
+    )
+
     def __init__(self, auth_client, expiration=DEFAULT_EXPIRATION):
         self._auth_client = auth_client
         self._expiration = expiration
@@ -55,11 +68,7 @@ class TokenRenewer(object):
         self._thread.join()
 
     def _run(self):
-        while True:
-            self._stopped.wait(self._renew_time)
-            if self._stopped.is_set():
-                return
-
+        while not self._stopped.wait(self._renew_time):
             self._renew_token()
 
     def _renew_token(self):
@@ -81,11 +90,14 @@ class TokenRenewer(object):
             )
         else:
             self._renew_time = self._RENEW_TIME_COEFFICIENT * self._expiration
+            if self._stopped.is_set():
+                logger.debug('token renewer stopped, not notifying the new token')
+                return
             self._notify_all(token)
 
     def _notify_all(self, token):
         with self._callback_lock:
-            callbacks = list(self._callbacks + self._callbacks_tmp)
+            callbacks = self._callbacks + self._callbacks_tmp
             self._callbacks_tmp = []
 
         for callback in callbacks: